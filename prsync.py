@@ -3,17 +3,20 @@
 import os
 import sys
 import argparse
+import itertools
 import subprocess
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from pathlib import Path
-from typing import List, Set, Tuple, Optional
+from typing import IO, Deque, List, Set, Tuple, Optional
 from dataclasses import dataclass
 import time
 import logging
-from queue import Queue
-from threading import Lock
+from logging.handlers import QueueHandler, QueueListener
+from collections import deque
+from queue import Empty, Queue
+import threading
 import re
-import atexit
+import weakref
 import shlex
 import shutil
 import tempfile
@@ -23,9 +26,71 @@ import traceback
 SSH_TIMEOUT = 300  # 5 minutes for SSH commands
 RSYNC_TIMEOUT = 3600  # 1 hour for rsync transfers
 RETRY_BACKOFF = [2, 4, 8]  # seconds between retries
-
-
-@dataclass
+# Prefer AES-GCM/ChaCha20 and leave compression to rsync -z
+SSH_TRANSPORT_OPTIONS = [
+    "-o", "Ciphers=aes128-gcm@openssh.com,chacha20-poly1305@openssh.com,aes128-ctr",
+    "-o", "MACs=umac-64-etm@openssh.com,hmac-sha2-256-etm@openssh.com",
+    "-o", "Compression=no",
+    "-o", "ServerAliveInterval=60",
+]
+# Drop the per-instance __dict__ where dataclasses support it (Python 3.10+)
+_DATACLASS_SLOTS = {"slots": True} if sys.version_info >= (3, 10) else {}
+# [user@]host:path, anchored with \Z so a trailing newline never matches
+_TARGET_RE = re.compile(r"^(?:([^@]+)@)?([^:]+):(.+)\Z")
+# Itemized (--out-format=%i %n) line for a regular file; group 1 is the path
+_ITEMIZE_FILE_RE = re.compile(r"^[<>ch.]f\S+ (.+)\Z")
+STDERR_TAIL_LINES = 50  # rsync stderr lines kept for failure reports
+# Fast-link transfers: skip the delta algorithm and compression. Not --inplace:
+# a killed transfer would leave a truncated file under its final name, which
+# --ignore-existing would then skip on every retry and later run.
+LAN_RSYNC_ARGS = ["--whole-file", "--no-compress"]
+# rsync flags that already decide which existing target files to skip
+SKIP_EXISTING_ARGS = {"--ignore-existing", "--existing", "--checksum", "--update"}
+SKIP_EXISTING_SHORT_ARGS = "cu"  # -c/--checksum, -u/--update
+# Short rsync options that take a value, ending a cluster like -avB1024
+_RSYNC_SHORT_WITH_VALUE = "BefMT@"
+# Long rsync options that take a value, given either as --opt=VALUE or as the
+# next argument; the separate form must not be scanned as options itself
+_RSYNC_LONG_WITH_VALUE = frozenset({
+    "--address", "--backup-dir", "--block-size", "--bwlimit", "--checksum-choice",
+    "--checksum-seed", "--chmod", "--chown", "--compare-dest", "--compress-choice",
+    "--compress-level", "--contimeout", "--copy-as", "--copy-dest", "--debug",
+    "--exclude", "--exclude-from", "--files-from", "--filter", "--groupmap",
+    "--iconv", "--include", "--include-from", "--info", "--link-dest",
+    "--log-file", "--log-file-format", "--max-alloc", "--max-delete",
+    "--max-size", "--min-size", "--modify-window", "--only-write-batch",
+    "--out-format", "--outbuf", "--partial-dir", "--password-file", "--port",
+    "--protocol", "--read-batch", "--remote-option", "--rsh", "--rsync-path",
+    "--skip-compress", "--sockopts", "--stop-after", "--stop-at", "--suffix",
+    "--temp-dir", "--timeout", "--usermap", "--write-batch",
+})
+
+
+def _has_rsync_option(args: List[str], long_options: Set[str], short_options: str) -> bool:
+    """Return True if args contain any of the options, including inside
+    short-option clusters such as -avu. Option values, attached or given as
+    the next argument (-f '- *.cache'), are never scanned."""
+    takes_value = False
+    for arg in args:
+        if takes_value:
+            takes_value = False
+            continue
+        if arg.startswith("--"):
+            name = arg.split("=", 1)[0]
+            if name in long_options:
+                return True
+            takes_value = "=" not in arg and name in _RSYNC_LONG_WITH_VALUE
+        elif arg.startswith("-"):
+            for i, flag in enumerate(arg[1:], 1):
+                if flag in short_options:
+                    return True
+                if flag in _RSYNC_SHORT_WITH_VALUE:
+                    takes_value = i == len(arg) - 1
+                    break
+    return False
+
+
+@dataclass(**_DATACLASS_SLOTS)
 class RemoteTarget:
     user: Optional[str]
     host: str
@@ -37,7 +102,7 @@ class RemoteTarget:
         """Parse a target string like 'user@host:/path' or 'host:/path'"""
         if os.name == "nt" and len(target) >= 2 and target[1] == ":":
             return None
-        match = re.match(r"^(?:([^@]+)@)?([^:]+):(.+)$", target)
+        match = _TARGET_RE.match(target)
         if match:
             user, host, path = match.groups()
             return cls(user=user, host=host, path=path)
@@ -50,19 +115,38 @@ class RemoteTarget:
         return f"{self.host}:{self.path}"
 
     def ssh_base_args(self) -> List[str]:
-        """Return base SSH arguments including user and control path if available"""
-        args = ["ssh"]
+        """Return base SSH arguments including user and control path if available.
+
+        Once a master connection exists, clients only ever attach to it and run
+        in batch mode, so a dead master fails fast instead of hanging a worker
+        on a password prompt.
+        """
+        args = ["ssh", "-T"] + SSH_TRANSPORT_OPTIONS
         if self.control_path:
-            args.extend(["-o", f"ControlPath={self.control_path}"])
+            args.extend([
+                "-o", f"ControlPath={self.control_path}",
+                "-o", "ControlMaster=no",
+                "-o", "BatchMode=yes",
+            ])
         if self.user:
             args.extend(["-l", self.user])
         return args
 
     def setup_ssh_multiplexing(self):
-        """Setup SSH connection multiplexing"""
-        temp_dir = tempfile.mkdtemp(prefix="rsync_ssh_")
-        self.control_path = os.path.join(temp_dir, "control_%h_%p_%r")
+        """Setup SSH connection multiplexing; a no-op if already established"""
+        if self.control_path:
+            return True
+        # Keep the control socket on tmpfs when available so every multiplexed
+        # lookup hits RAM rather than a possibly slow /tmp; fall back to the
+        # default temp dir when /dev/shm is missing or not writable
+        try:
+            temp_dir = tempfile.mkdtemp(prefix="rsync_ssh_", dir="/dev/shm")
+        except OSError:
+            temp_dir = tempfile.mkdtemp(prefix="rsync_ssh_")
+        control_path = os.path.join(temp_dir, "control_%h_%p_%r")
 
+        # Built before control_path is set: the master may still need to
+        # prompt for credentials, which client batch mode would forbid
         ssh_cmd = self.ssh_base_args()
         ssh_cmd.extend(
             [
@@ -70,19 +154,19 @@ class RemoteTarget:
                 "-o",
                 "ControlMaster=yes",
                 "-o",
-                f"ControlPath={self.control_path}",
+                f"ControlPath={control_path}",
                 "-o",
-                "ControlPersist=yes",
+                "ControlPersist=600",
                 self.host,
             ]
         )
 
         try:
-            subprocess.run(ssh_cmd, check=True, timeout=SSH_TIMEOUT)
+            subprocess.run(ssh_cmd, check=True, timeout=SSH_TIMEOUT, close_fds=False)
+            self.control_path = control_path
             return True
         except (subprocess.CalledProcessError, subprocess.TimeoutExpired) as e:
             logging.error(f"Failed to setup SSH multiplexing: {e}")
-            self.control_path = None
             shutil.rmtree(temp_dir, ignore_errors=True)
             return False
 
@@ -95,7 +179,7 @@ class RemoteTarget:
             )
 
             try:
-                subprocess.run(ssh_cmd, check=True, timeout=SSH_TIMEOUT)
+                subprocess.run(ssh_cmd, check=True, timeout=SSH_TIMEOUT, close_fds=False)
             except (subprocess.CalledProcessError, subprocess.TimeoutExpired):
                 pass
 
@@ -106,14 +190,14 @@ class RemoteTarget:
                     pass
 
 
-@dataclass
+@dataclass(**_DATACLASS_SLOTS)
 class RsyncJob:
-    source_files: List[Path]
+    source_files: List[str]  # paths relative to source_base
     source_base: Path
     target: str
     rsync_args: List[str]
     job_id: int
-    control_path: Optional[str] = None
+    timeout: int = RSYNC_TIMEOUT  # seconds allowed per rsync attempt
 
 
 class ParallelRsync:
@@ -125,6 +209,10 @@ class ParallelRsync:
         bucket_size_mb: int = 1000,
         rsync_args: Optional[List[str]] = None,
         retry_count: int = 3,
+        skip_existing: bool = True,
+        bucket_files: Optional[int] = None,
+        lan: bool = False,
+        local_copy: bool = False,
     ):
         self.source = source_dir
         self.target = target
@@ -138,46 +226,61 @@ class ParallelRsync:
                 "Remote-to-remote transfers are not supported. "
                 "Source and target cannot both be remote hosts."
             )
+        if bucket_files is not None and bucket_files < 1:
+            raise ValueError("Bucket file count must be at least 1")
         self.parallel_jobs = parallel_jobs
         self.bucket_size_mb = bucket_size_mb
-        self.rsync_args = rsync_args if rsync_args else []
+        self.bucket_files = bucket_files
+        self.rsync_args = list(rsync_args) if rsync_args else []
         self.retry_count = retry_count
+        self.skip_existing = skip_existing
 
-        # Setup SSH multiplexing for remote source
-        if self.is_remote_source:
-            if not self.remote_source.setup_ssh_multiplexing():
-                logging.warning(
-                    "SSH multiplexing setup failed for source, "
-                    "falling back to non-multiplexed SSH"
-                )
-            else:
-                atexit.register(self.remote_source.cleanup_ssh_multiplexing)
-
-        # Setup SSH multiplexing for remote target
-        if self.is_remote_target:
-            if not self.remote_target.setup_ssh_multiplexing():
-                logging.warning(
-                    "SSH multiplexing setup failed for target, "
-                    "falling back to non-multiplexed SSH"
-                )
-            else:
-                atexit.register(self.remote_target.cleanup_ssh_multiplexing)
-
-        self.current_bucket: List[Tuple[Path, int]] = []
-        self.current_bucket_size = 0
-        self.buckets: List[List[Path]] = []
+        # Let rsync skip files already present at the target instead of
+        # checking each one ourselves, unless the user's flags already decide
+        user_decides_existing = _has_rsync_option(
+            self.rsync_args, SKIP_EXISTING_ARGS, SKIP_EXISTING_SHORT_ARGS
+        )
+        if skip_existing and not user_decides_existing:
+            self.rsync_args.append("--ignore-existing")
+
+        # On a fast link the rolling checksum costs more CPU than the bytes it
+        # saves; --checksum still compares whole-file checksums to pick files
+        if lan:
+            self.rsync_args.extend(arg for arg in LAN_RSYNC_ARGS if arg not in self.rsync_args)
+
+        self.local_copy = local_copy
+        if local_copy and (self.is_remote_source or self.is_remote_target):
+            logging.warning("Local copy mode only applies to local-to-local transfers, using rsync")
+            self.local_copy = False
+        elif local_copy and _has_rsync_option(self.rsync_args, {"--dry-run"}, "n"):
+            logging.warning("Local copy mode does not support dry runs, using rsync")
+            self.local_copy = False
+        elif local_copy and _has_rsync_option(
+            self.rsync_args, SKIP_EXISTING_ARGS - {"--ignore-existing"}, SKIP_EXISTING_SHORT_ARGS
+        ):
+            # Its existence pre-check cannot reproduce --update/--checksum/--existing
+            logging.warning("Local copy mode cannot honour --update/--checksum/--existing, using rsync")
+            self.local_copy = False
+
+        # SSH multiplexing is set up lazily by _ensure_ssh() on first use
+        self._ssh_lock = threading.Lock()
+        self._ssh_ready = False
+
+        self._bucket_paths: List[str] = []
+        self._bucket_size = 0
+        self.buckets: List[List[str]] = []
+        self.bucket_bytes: List[int] = []  # total size per bucket, 0 when unknown
 
         self.logger = logging.getLogger(__name__)
-        self.progress_lock = Lock()
         self.total_files = 0
-        self.completed_files = 0
+        self._completed = itertools.count(1)
         self.failed_transfers = Queue()
-        self._remote_target_manifest: Set[str] = set()
         self._active_processes: List[subprocess.Popen] = []
-        atexit.register(self._terminate_all)
+        self._terminate_finalizer = self._register_terminate_finalizer()
 
-    def _get_remote_file_list(self, remote: RemoteTarget) -> List[Tuple[str, int]]:
-        """Get list of files and sizes from remote host"""
+    def _get_remote_file_list(self, remote: RemoteTarget) -> Tuple[List[str], List[int]]:
+        """Get parallel lists of file paths and sizes from remote host"""
+        self._ensure_ssh()
         ssh_cmd = remote.ssh_base_args()
         
         # Use find to get file paths and sizes
@@ -186,12 +289,14 @@ class ParallelRsync:
         
         try:
             result = subprocess.run(ssh_cmd, capture_output=True, text=True,
-                                     check=True, timeout=SSH_TIMEOUT)
-            files = []
+                                     check=True, timeout=SSH_TIMEOUT, close_fds=False)
+            paths: List[str] = []
+            sizes: List[int] = []
             for line in result.stdout.splitlines():
                 size, path = line.strip().split(" ", 1)
-                files.append((path, int(size)))
-            return files
+                paths.append(path)
+                sizes.append(int(size))
+            return paths, sizes
         except (subprocess.CalledProcessError, subprocess.TimeoutExpired) as e:
             stderr_hint = getattr(e, 'stderr', '')
             if stderr_hint and 'invalid predicate' in stderr_hint:
@@ -203,81 +308,197 @@ class ParallelRsync:
                 self.logger.error(f"Failed to get remote file list: {e}")
             raise
 
+    def _scan_dir(self, path: str, prefix: str) -> Tuple[List[str], List[int], List[Tuple[str, str]]]:
+        """Scan a single local directory.
+
+        Returns the relative paths and sizes of its files, plus the
+        (path, prefix) pairs of subdirectories still to be scanned. Sizes
+        are left empty when bucketing by file count, so no file is stat'ed.
+        """
+        paths: List[str] = []
+        sizes: List[int] = []
+        subdirs: List[Tuple[str, str]] = []
+        try:
+            with os.scandir(path) as it:
+                for entry in it:
+                    try:
+                        if entry.is_dir():
+                            # Like os.walk, don't descend into symlinked directories
+                            if not entry.is_symlink():
+                                subdirs.append((entry.path, prefix + entry.name + os.sep))
+                            continue
+                        if self.bucket_files is None:
+                            sizes.append(entry.stat().st_size)
+                        paths.append(prefix + entry.name)
+                    except OSError as e:
+                        self.logger.error(f"Error accessing file {entry.path}: {e}")
+        except OSError as e:
+            self.logger.error(f"Error walking directory: {e}")
+        return paths, sizes, subdirs
+
+    def _scan_local(self, source_base: str) -> Tuple[List[str], List[int]]:
+        """Walk the local source tree, fanning directories out to a thread pool"""
+        paths: List[str] = []
+        sizes: List[int] = []
+        with ThreadPoolExecutor(max_workers=self.parallel_jobs) as executor:
+            pending = {executor.submit(self._scan_dir, source_base, "")}
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    dir_paths, dir_sizes, subdirs = future.result()
+                    paths.extend(dir_paths)
+                    sizes.extend(dir_sizes)
+                    pending.update(executor.submit(self._scan_dir, *d) for d in subdirs)
+        return paths, sizes
+
+    def _flush_bucket(self):
+        """Close the bucket being filled, if any"""
+        if self._bucket_paths:
+            self.buckets.append(self._bucket_paths)
+            self.bucket_bytes.append(self._bucket_size)
+            self._bucket_paths = []
+            self._bucket_size = 0
+
     def scan_and_distribute(self):
         """Scan directory and distribute files into buckets based on size"""
         if self.is_remote_source:
             self.logger.info(f"Scanning remote directory: {self.remote_source}")
-            files = self._get_remote_file_list(self.remote_source)
-            source_base = self.remote_source.path
+            paths, sizes = self._get_remote_file_list(self.remote_source)
         else:
             self.logger.info(f"Scanning local directory: {self.source}")
             source_base = Path(self.source).resolve()
             if not source_base.exists():
                 raise ValueError(f"Source directory does not exist: {source_base}")
+            paths, sizes = self._scan_local(str(source_base))
+
+        self.total_files = len(paths)
+        sep = "/" if self.is_remote_source else os.sep
+
+        def locality_key(i: int) -> Tuple[List[str], str]:
+            # Component-wise (dir parts, name) ordering keeps every directory's
+            # files, and every subtree, contiguous
+            head, _, name = paths[i].rpartition(sep)
+            return head.split(sep), name
+
+        if self.bucket_files is not None:
+            order = sorted(range(len(paths)), key=locality_key)
+            self.buckets = [
+                [paths[i] for i in order[j:j + self.bucket_files]]
+                for j in range(0, len(order), self.bucket_files)
+            ]
+            self.bucket_bytes = [0] * len(self.buckets)
+            self.logger.info(
+                f"Found {self.total_files} files in {len(self.buckets)} buckets"
+            )
+            return
 
-            files = []
-            for root, _, filenames in os.walk(source_base, onerror=lambda err: self.logger.error(
-                f"Error walking directory: {err}"
-            )):
-                for filename in filenames:
-                    filepath = Path(root) / filename
-                    try:
-                        files.append((str(filepath.relative_to(source_base)), filepath.stat().st_size))
-                    except OSError as e:
-                        self.logger.error(f"Error accessing file {filepath}: {e}")
-
-        # Sort by size descending so large files claim their own bucket first
-        files.sort(key=lambda f: f[1], reverse=True)
-
-        for filepath, file_size in files:
-            self.total_files += 1
-            # Files larger than bucket size get their own bucket
-            if file_size >= (self.bucket_size_mb * 1024 * 1024):
-                if self.current_bucket:
-                    self.buckets.append([path for path, _ in self.current_bucket])
-                    self.current_bucket = []
-                    self.current_bucket_size = 0
-                self.buckets.append([filepath])
-                continue
-            self.current_bucket.append((filepath, file_size))
-            self.current_bucket_size += file_size
+        threshold = self.bucket_size_mb * 1024 * 1024
 
-            if self.current_bucket_size >= (self.bucket_size_mb * 1024 * 1024):
-                self.buckets.append([path for path, _ in self.current_bucket])
-                self.current_bucket = []
-                self.current_bucket_size = 0
+        # Files larger than bucket size get their own bucket, largest first
+        oversized = sorted(
+            (i for i in range(len(paths)) if sizes[i] >= threshold),
+            key=sizes.__getitem__, reverse=True,
+        )
+        for i in oversized:
+            self.buckets.append([paths[i]])
+            self.bucket_bytes.append(sizes[i])
+
+        # Pack the rest in directory order so each bucket covers whole
+        # directories where possible and rsync revisits as few as it can
+        order = sorted((i for i in range(len(paths)) if sizes[i] < threshold), key=locality_key)
+        for i in order:
+            self._bucket_paths.append(paths[i])
+            self._bucket_size += sizes[i]
 
-        if self.current_bucket:
-            self.buckets.append([path for path, _ in self.current_bucket])
+            if self._bucket_size >= threshold:
+                self._flush_bucket()
 
-        # Free the file list now that buckets are built
-        del files
+        self._flush_bucket()
 
         self.logger.info(
             f"Found {self.total_files} files in {len(self.buckets)} buckets"
         )
 
-    def _build_remote_target_manifest(self):
-        """Build a set of all file paths on the remote target for O(1) existence checks"""
-        base = self.remote_target.path.rstrip('/')
-        ssh_cmd = self.remote_target.ssh_base_args()
-        find_cmd = f"find {shlex.quote(base)} -type f"
-        ssh_cmd.extend([self.remote_target.host, find_cmd])
+    def _advance_progress(self, count: int) -> int:
+        """Record count completed files and return the running total.
 
+        Each next() on the itertools.count is atomic under the GIL, so worker
+        threads never contend on a lock just to bump the counter.
+        """
+        done = 0
+        for _ in range(count):
+            done = next(self._completed)
+        return done
+
+    @staticmethod
+    def _write_file_list(stream: IO[str], file_list: str):
+        """Write the NUL-separated file list to rsync's stdin and close it"""
         try:
-            result = subprocess.run(ssh_cmd, capture_output=True, text=True,
-                                     check=True, timeout=SSH_TIMEOUT)
-            self._remote_target_manifest = set(result.stdout.splitlines())
-            self.logger.info(
-                f"Remote target manifest: {len(self._remote_target_manifest)} files"
-            )
-        except (subprocess.CalledProcessError, subprocess.TimeoutExpired) as e:
-            self.logger.error(f"Failed to build remote target manifest: {e}")
-            raise
+            stream.write(file_list)
+        except OSError:
+            pass  # rsync exited or was killed; its exit status says why
+        finally:
+            try:
+                stream.close()
+            except OSError:
+                pass
+
+    def _read_itemized_output(self, stream: IO[str], transferred: Set[str]):
+        """Advance progress live from rsync's itemized stdout, discarding other lines"""
+        for line in stream:
+            match = _ITEMIZE_FILE_RE.match(line.rstrip("\n"))
+            if not match or match.group(1) in transferred:
+                continue
+            transferred.add(match.group(1))
+            done = self._advance_progress(1)
+            # Once per transferred file: skip building the message under --quiet
+            if self.logger.isEnabledFor(logging.INFO):
+                progress = (done / self.total_files) * 100
+                self.logger.info(
+                    f"Transferred: {match.group(1)} - Progress: {progress:.1f}% ({done}/{self.total_files})"
+                )
+
+    def _ensure_ssh(self):
+        """Set up SSH multiplexing for the remote endpoint on first use.
+
+        Nothing is spawned until a scan or transfer needs the connection, and
+        the lock makes sure only one worker establishes the master.
+        """
+        with self._ssh_lock:
+            if self._ssh_ready:
+                return
+            self._ssh_ready = True
+            if self.is_remote_source:
+                remote, role = self.remote_source, "source"
+            elif self.is_remote_target:
+                remote, role = self.remote_target, "target"
+            else:
+                return
+            if not remote.setup_ssh_multiplexing():
+                logging.warning(
+                    f"SSH multiplexing setup failed for {role}, "
+                    "falling back to non-multiplexed SSH"
+                )
+            else:
+                weakref.finalize(self, remote.cleanup_ssh_multiplexing)
+                # Finalizers run newest first; re-register so rsync children are
+                # terminated before their SSH master is told to exit
+                self._terminate_finalizer.detach()
+                self._terminate_finalizer = self._register_terminate_finalizer()
+
+    def _register_terminate_finalizer(self) -> weakref.finalize:
+        """Terminate child processes when this object is collected or at exit"""
+        # Bound to the process list, not self, so the object can still be collected
+        return weakref.finalize(self, ParallelRsync._terminate_processes, self._active_processes)
 
     def _terminate_all(self):
         """Terminate all active rsync subprocesses"""
-        procs = list(self._active_processes)
+        self._terminate_processes(self._active_processes)
+
+    @staticmethod
+    def _terminate_processes(active: List[subprocess.Popen]):
+        """Terminate the given subprocesses, killing any that do not exit"""
+        procs = list(active)
         for proc in procs:
             try:
                 proc.terminate()
@@ -291,146 +512,263 @@ class ParallelRsync:
                     proc.kill()
                 except OSError:
                     pass
-        self._active_processes.clear()
+        active.clear()
 
-    def execute_rsync(self, job: RsyncJob) -> bool:
-        """Execute rsync for a given bucket of files"""
-        files_to_sync = []
-        
-        # Check each file if it needs to be synced
-        for source_file in job.source_files:
-            relative_path = str(source_file)
-            should_sync = True
-            if self.is_remote_target:
-                base = self.remote_target.path.rstrip('/')
-                target_path = f"{base}/{relative_path}"
-                should_sync = target_path not in self._remote_target_manifest
-            else:
-                target_file = Path(self.target) / relative_path
-                should_sync = not target_file.exists()
-            
-            if should_sync:
-                files_to_sync.append(relative_path)
-            else:
-                with self.progress_lock:
-                    self.completed_files += 1
-                    progress = (self.completed_files / self.total_files) * 100
-                    self.logger.info(
-                        f"Skipping existing file: {relative_path} - Progress: {progress:.1f}% ({self.completed_files}/{self.total_files})"
-                    )
-        
-        if not files_to_sync:
-            return True
+    @staticmethod
+    def _copy_file_atomic(src: str, dst: str):
+        """Copy src to dst through a temporary sibling renamed into place.
+
+        A failed or interrupted copy never leaves a partial file under the
+        final name, where the skip-existing check would keep skipping it.
+        """
+        fd, tmp = tempfile.mkstemp(prefix=".prsync_", dir=os.path.dirname(dst))
+        os.close(fd)
+        try:
+            if os.path.islink(src):
+                # copy2 recreates the link itself and refuses an existing name
+                os.unlink(tmp)
+            shutil.copy2(src, tmp, follow_symlinks=False)
+            os.replace(tmp, dst)
+        except BaseException:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+            raise
+
+    def _copy_local(self, job: RsyncJob) -> bool:
+        """Copy a bucket between local directories without spawning rsync.
+
+        shutil.copy2 goes through os.sendfile on Linux, so file data stays in
+        the kernel and the GIL is released while the worker copies. Files that
+        fail are retried like rsync jobs, after the rest of the bucket is done.
+        """
+        source_base = str(job.source_base)
+        target_base = str(job.target)
+        pending = job.source_files
 
         last_error: Optional[str] = None
         for attempt in range(self.retry_count):
             if attempt > 0:
                 delay = RETRY_BACKOFF[min(attempt - 1, len(RETRY_BACKOFF) - 1)]
                 self.logger.warning(
-                    f"Retrying job {job.job_id} in {delay}s (attempt {attempt + 1}/{self.retry_count})"
+                    f"Retrying {len(pending)} files of job {job.job_id} in {delay}s "
+                    f"(attempt {attempt + 1}/{self.retry_count})"
                 )
                 time.sleep(delay)
 
-            tmpfile = tempfile.NamedTemporaryFile(
-                mode="w", prefix="rsync_filelist_", suffix=f"_{job.job_id}",
-                delete=False
-            )
-            bucket_file_list = tmpfile.name
-
-            try:
-                tmpfile.write("\0".join(files_to_sync))
-                tmpfile.close()
+            failed: List[str] = []
+            created_dir: Optional[str] = None
+            for relative_path in pending:
+                dst = os.path.join(target_base, relative_path)
+                if self.skip_existing and os.path.lexists(dst):
+                    continue
+                # Buckets are packed in directory order, so consecutive files
+                # usually share a parent that only needs creating once
+                parent = os.path.dirname(dst)
+                try:
+                    if parent != created_dir:
+                        os.makedirs(parent, exist_ok=True)
+                        created_dir = parent
+                    self._copy_file_atomic(os.path.join(source_base, relative_path), dst)
+                except OSError as e:
+                    last_error = str(e)
+                    self.logger.error(f"Failed to copy {relative_path} for job {job.job_id}: {e}")
+                    failed.append(relative_path)
+
+            if not failed:
+                done = self._advance_progress(len(job.source_files))
+                progress = (done / self.total_files) * 100
+                self.logger.info(
+                    f"Progress: {progress:.1f}% ({done}/{self.total_files})"
+                )
+                return True
+            pending = failed
 
-                cmd = ["rsync"] + job.rsync_args
+        self.failed_transfers.put((job, last_error or "unknown"))
+        self.logger.error(f"Job {job.job_id} failed after {self.retry_count} attempts")
+        return False
 
-                if self.is_remote_source and self.remote_source.control_path:
-                    rsh = " ".join(self.remote_source.ssh_base_args())
-                    cmd.extend(["--rsh", rsh])
+    def execute_rsync(self, job: RsyncJob) -> bool:
+        """Execute rsync for a given bucket of files"""
+        if self.local_copy:
+            return self._copy_local(job)
+        self._ensure_ssh()
 
-                if self.is_remote_target and self.remote_target.control_path:
-                    rsh = " ".join(self.remote_target.ssh_base_args())
-                    cmd.extend(["--rsh", rsh])
+        files_to_sync = job.source_files
+        file_list = "\0".join(files_to_sync)
+        # Paths rsync reported as transferred, kept across retries so each
+        # file advances the progress counter only once
+        transferred: Set[str] = set()
 
-                source_path = (
-                    f"{str(self.remote_source)}/"
-                    if self.is_remote_source
-                    else f"{str(job.source_base)}/"
+        last_error: Optional[str] = None
+        for attempt in range(self.retry_count):
+            if attempt > 0:
+                delay = RETRY_BACKOFF[min(attempt - 1, len(RETRY_BACKOFF) - 1)]
+                self.logger.warning(
+                    f"Retrying job {job.job_id} in {delay}s (attempt {attempt + 1}/{self.retry_count})"
                 )
+                time.sleep(delay)
 
-                cmd.extend(["--files-from=" + bucket_file_list, "--from0", source_path, job.target])
+            cmd = ["rsync"] + job.rsync_args
 
-                self.logger.debug(f"Executing rsync command: {' '.join(cmd)}")
+            if self.is_remote_source and self.remote_source.control_path:
+                rsh = shlex.join(self.remote_source.ssh_base_args())
+                cmd.extend(["--rsh", rsh])
 
-                process = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=None)
-                self._active_processes.append(process)
-                try:
-                    process.wait(timeout=RSYNC_TIMEOUT)
-                except subprocess.TimeoutExpired:
-                    last_error = "timeout"
-                    self.logger.error(f"Rsync timed out for job {job.job_id}")
-                    process.kill()
-                    process.wait()
-                    continue
-                finally:
-                    self._active_processes.remove(process)
+            if self.is_remote_target and self.remote_target.control_path:
+                rsh = shlex.join(self.remote_target.ssh_base_args())
+                cmd.extend(["--rsh", rsh])
 
-                if process.returncode != 0:
-                    last_error = f"exit code {process.returncode}"
-                    self.logger.error(f"Rsync failed for job {job.job_id} ({last_error})")
-                    continue
+            source_path = (
+                f"{str(self.remote_source)}/"
+                if self.is_remote_source
+                else f"{str(job.source_base)}/"
+            )
 
-                with self.progress_lock:
-                    self.completed_files += len(files_to_sync)
-                    progress = (self.completed_files / self.total_files) * 100
-                    self.logger.info(
-                        f"Progress: {progress:.1f}% ({self.completed_files}/{self.total_files})"
-                    )
+            cmd.extend([
+                "--out-format=%i %n",
+                "--files-from=-", "--from0", source_path, job.target,
+            ])
 
-                return True
+            if self.logger.isEnabledFor(logging.DEBUG):
+                self.logger.debug(f"Executing rsync command: {' '.join(cmd)}")
 
+            process = subprocess.Popen(
+                cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                text=True, bufsize=1, errors="surrogateescape",
+            )
+            self._active_processes.append(process)
+            stderr_tail: Deque[str] = deque(maxlen=STDERR_TAIL_LINES)
+            # Feed stdin from its own thread as well, so a stalled rsync that
+            # stops reading the file list is still caught by the timeout
+            pipes = [
+                threading.Thread(target=self._write_file_list,
+                                 args=(process.stdin, file_list), daemon=True),
+                threading.Thread(target=self._read_itemized_output,
+                                 args=(process.stdout, transferred), daemon=True),
+                threading.Thread(target=stderr_tail.extend, args=(process.stderr,), daemon=True),
+            ]
+            for pipe in pipes:
+                pipe.start()
+            try:
+                process.wait(timeout=job.timeout)
+            except subprocess.TimeoutExpired:
+                last_error = "timeout"
+                self.logger.error(f"Rsync timed out for job {job.job_id}")
+                process.kill()
+                process.wait()
+                continue
             finally:
-                try:
-                    os.unlink(bucket_file_list)
-                except OSError:
-                    pass
+                self._active_processes.remove(process)
+                for pipe in pipes:
+                    pipe.join()
+
+            if process.returncode != 0:
+                last_error = f"exit code {process.returncode}"
+                self.logger.error(f"Rsync failed for job {job.job_id} ({last_error})")
+                if stderr_tail:
+                    self.logger.error("rsync stderr:\n" + "".join(stderr_tail).rstrip())
+                continue
+
+            # Files rsync skipped or did not itemize are counted once the bucket is done
+            remaining = len(files_to_sync) - len(transferred)
+            if remaining > 0:
+                done = self._advance_progress(remaining)
+                progress = (done / self.total_files) * 100
+                self.logger.info(
+                    f"Progress: {progress:.1f}% ({done}/{self.total_files})"
+                )
+
+            return True
 
         self.failed_transfers.put((job, last_error or "unknown"))
         self.logger.error(f"Job {job.job_id} failed after {self.retry_count} attempts")
         return False
 
+    def _run_jobs(self, jobs: List[RsyncJob]) -> List[bool]:
+        """Execute jobs on parallel_jobs worker threads pulling from a shared queue.
+
+        Workers take the next job as soon as they finish one, so no worker sits
+        idle while work remains. The first exception raised by a job stops the
+        remaining jobs from being picked up and is re-raised here.
+        """
+        job_queue: Queue = Queue()
+        for job in jobs:
+            job_queue.put(job)
+        results: List[bool] = []
+        errors: List[BaseException] = []
+        stop = threading.Event()
+
+        def worker():
+            while not stop.is_set():
+                try:
+                    job = job_queue.get_nowait()
+                except Empty:
+                    return
+                try:
+                    results.append(self.execute_rsync(job))
+                except Exception as e:
+                    errors.append(e)
+                    stop.set()
+
+        workers = [
+            threading.Thread(target=worker, name=f"prsync-worker-{i}")
+            for i in range(min(max(self.parallel_jobs, 1), len(jobs)))
+        ]
+        for thread in workers:
+            thread.start()
+        try:
+            for thread in workers:
+                thread.join()
+        except KeyboardInterrupt:
+            self.logger.warning("Interrupted, terminating active transfers...")
+            stop.set()
+            self._terminate_all()
+            raise
+        finally:
+            for thread in workers:
+                thread.join()
+
+        if errors:
+            raise errors[0]
+        return results
+
     def run(self):
         """Run the parallel rsync operation"""
         start_time = time.time()
         self.scan_and_distribute()
 
-        if self.is_remote_target:
-            self._build_remote_target_manifest()
+        buckets = self.buckets
+        bucket_bytes = self.bucket_bytes
+        if self.parallel_jobs <= 1 and len(buckets) > 1:
+            # Nothing would run concurrently, so a single rsync over every file
+            # avoids paying process startup and file-list exchange per bucket
+            # The merged job carries every bucket's share of the time limit
+            timeout = RSYNC_TIMEOUT * len(buckets)
+            buckets = [[path for bucket in buckets for path in bucket]]
+            bucket_bytes = [sum(bucket_bytes)]
+        else:
+            timeout = RSYNC_TIMEOUT
 
         jobs = []
-        for i, bucket in enumerate(self.buckets):
+        for i, bucket in enumerate(buckets):
             job = RsyncJob(
-                source_files=[Path(f) for f in bucket],
+                source_files=bucket,
                 source_base=Path(self.remote_source.path if self.is_remote_source else self.source),
                 target=str(self.remote_target)
                 if self.is_remote_target
                 else str(self.target),
                 rsync_args=self.rsync_args,
                 job_id=i,
-                control_path=self.remote_target.control_path
-                if self.is_remote_target
-                else None,
+                timeout=timeout,
             )
             jobs.append(job)
 
-        executor = ThreadPoolExecutor(max_workers=self.parallel_jobs)
-        try:
-            results = list(executor.map(self.execute_rsync, jobs))
-        except KeyboardInterrupt:
-            self.logger.warning("Interrupted, terminating active transfers...")
-            self._terminate_all()
-            raise
-        finally:
-            executor.shutdown(wait=True)
+        # Largest buckets first (by bytes, then file count) so the longest
+        # transfers start immediately and small ones fill in at the end
+        jobs.sort(key=lambda j: (bucket_bytes[j.job_id], len(j.source_files)), reverse=True)
+        results = self._run_jobs(jobs)
 
         success_count = sum(1 for r in results if r)
         failed_count = len(results) - success_count
@@ -440,15 +778,31 @@ class ParallelRsync:
         self.logger.info(f"Successfully transferred: {success_count} buckets")
         if failed_count > 0:
             self.logger.error(f"Failed transfers: {failed_count} buckets")
-            while not self.failed_transfers.empty():
-                job, error = self.failed_transfers.get()
+            # All workers have been joined, so draining until Empty sees every failure
+            while True:
+                try:
+                    job, error = self.failed_transfers.get_nowait()
+                except Empty:
+                    break
                 self.logger.error(f"Job {job.job_id} failed with error: {error}")
 
 
-def setup_logging(level: int = logging.INFO):
-    logging.basicConfig(
-        level=level, format="%(asctime)s - %(levelname)s - %(message)s"
-    )
+def setup_logging(level: int = logging.INFO) -> QueueListener:
+    """Route log records through a queue drained by a background listener.
+
+    Worker threads format each record and enqueue it; the stderr handler,
+    its lock and the write to the stream run on the listener thread. Stop
+    the returned listener to flush pending records.
+    """
+    handler = logging.StreamHandler(sys.stderr)
+    handler.setFormatter(logging.Formatter("%(asctime)s - %(levelname)s - %(message)s"))
+    log_queue: Queue = Queue(-1)
+    root = logging.getLogger()
+    root.setLevel(level)
+    root.addHandler(QueueHandler(log_queue))
+    listener = QueueListener(log_queue, handler)
+    listener.start()
+    return listener
 
 
 def main():
@@ -469,6 +823,13 @@ def main():
         default=1000,
         help="Bucket size in MB (default: 1000)",
     )
+    parser.add_argument(
+        "--bucket-files",
+        type=int,
+        metavar="N",
+        help="Bucket by file count (N files per bucket) instead of size; "
+             "skips the per-file stat of the source tree",
+    )
     parser.add_argument(
         "--rsync-args",
         default="-avz --progress",
@@ -492,10 +853,28 @@ def main():
         "--retry", type=int, default=3,
         help="Number of retry attempts for failed bucket transfers (default: 3)"
     )
+    parser.add_argument(
+        "--lan", action="store_true",
+        help="Tune for a fast local network: add --whole-file --no-compress "
+             "to skip rsync's delta algorithm and compression (--checksum, if given, "
+             "still decides which files to send)"
+    )
+    parser.add_argument(
+        "--local-copy", action="store_true",
+        help="For local-to-local transfers, copy files directly (sendfile) instead "
+             "of running rsync; --rsync-args are ignored, permissions and "
+             "timestamps are preserved"
+    )
+    parser.add_argument(
+        "--skip-existing", action=argparse.BooleanOptionalAction, default=True,
+        help="Skip files that already exist at the target via rsync --ignore-existing; "
+             "not added when --rsync-args already contain -u/--update, -c/--checksum, "
+             "--existing or --ignore-existing, which then decide on their own"
+    )
 
     args = parser.parse_args()
 
-    setup_logging(level=args.log_level)
+    log_listener = setup_logging(level=args.log_level)
 
     rsync_args = shlex.split(args.rsync_args)
     if args.dry_run:
@@ -509,6 +888,10 @@ def main():
             bucket_size_mb=args.bucket_size,
             rsync_args=rsync_args,
             retry_count=args.retry,
+            skip_existing=args.skip_existing,
+            bucket_files=args.bucket_files,
+            lan=args.lan,
+            local_copy=args.local_copy,
         )
 
         parallel_rsync.run()
@@ -520,6 +903,8 @@ def main():
         logging.error(f"Error: {e}")
         logging.debug(traceback.format_exc())
         sys.exit(1)
+    finally:
+        log_listener.stop()
 
 
 if __name__ == "__main__":
@@ -1,15 +1,19 @@
+import logging
 import os
 import sys
 import subprocess
 import tempfile
 import shutil
+from logging.handlers import QueueHandler
 from pathlib import Path
 from unittest.mock import patch, MagicMock, call
 
 import pytest
 
 sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
-from prsync import RemoteTarget, ParallelRsync, RsyncJob
+from prsync import (
+    RemoteTarget, ParallelRsync, RsyncJob, RSYNC_TIMEOUT, SSH_TRANSPORT_OPTIONS, setup_logging,
+)
 
 
 class TestRemoteTarget:
@@ -30,6 +34,9 @@ class TestRemoteTarget:
         assert target.host == "host"
         assert target.path == "/remote/path"
 
+    def test_parse_rejects_trailing_newline(self):
+        assert RemoteTarget.parse("host:/remote/path\n") is None
+
     def test_str_with_user(self):
         target = RemoteTarget(user="user", host="host", path="/remote/path")
         assert str(target) == "user@host:/remote/path"
@@ -40,11 +47,14 @@ class TestRemoteTarget:
 
     def test_ssh_base_args_without_control_path(self):
         target = RemoteTarget(user="user", host="host", path="/p")
-        assert target.ssh_base_args() == ["ssh", "-l", "user"]
+        assert target.ssh_base_args() == ["ssh", "-T"] + SSH_TRANSPORT_OPTIONS + ["-l", "user"]
 
     def test_ssh_base_args_with_control_path(self):
         target = RemoteTarget(user="u", host="h", path="/p", control_path="/tmp/cp")
-        assert target.ssh_base_args() == ["ssh", "-o", "ControlPath=/tmp/cp", "-l", "u"]
+        assert target.ssh_base_args() == (
+            ["ssh", "-T"] + SSH_TRANSPORT_OPTIONS
+            + ["-o", "ControlPath=/tmp/cp", "-o", "ControlMaster=no", "-o", "BatchMode=yes", "-l", "u"]
+        )
 
     def test_setup_ssh_multiplexing_success(self):
         target = RemoteTarget(user="u", host="h", path="/p")
@@ -52,6 +62,28 @@ class TestRemoteTarget:
             assert target.setup_ssh_multiplexing() is True
             assert target.control_path is not None
             mock_run.assert_called_once()
+            ssh_cmd = mock_run.call_args[0][0]
+            assert "ControlMaster=yes" in ssh_cmd
+            assert "ControlMaster=no" not in ssh_cmd
+            assert "BatchMode=yes" not in ssh_cmd
+        shutil.rmtree(os.path.dirname(target.control_path), ignore_errors=True)
+        target.control_path = None
+
+    def test_setup_ssh_multiplexing_falls_back_when_shm_unwritable(self):
+        target = RemoteTarget(user="u", host="h", path="/p")
+        mkdtemp = tempfile.mkdtemp
+
+        def fake_mkdtemp(prefix=None, dir=None):
+            if dir == "/dev/shm":
+                raise PermissionError(13, "Permission denied", dir)
+            return mkdtemp(prefix=prefix, dir=dir)
+
+        with patch("prsync.subprocess.run"), patch("prsync.tempfile.mkdtemp", side_effect=fake_mkdtemp):
+            assert target.setup_ssh_multiplexing() is True
+        control_dir = os.path.dirname(target.control_path)
+        assert os.path.dirname(control_dir) == tempfile.gettempdir()
+        shutil.rmtree(control_dir, ignore_errors=True)
+        target.control_path = None
 
     def test_setup_ssh_multiplexing_failure(self):
         target = RemoteTarget(user="u", host="h", path="/p")
@@ -59,6 +91,13 @@ class TestRemoteTarget:
             assert target.setup_ssh_multiplexing() is False
             assert target.control_path is None
 
+    @pytest.mark.skipif(sys.version_info < (3, 10), reason="dataclass slots need Python 3.10+")
+    def test_dataclasses_use_slots(self):
+        target = RemoteTarget(user=None, host="h", path="/p")
+        job = RsyncJob(source_files=["f"], source_base=Path("/p"), target="/t", rsync_args=[], job_id=0)
+        assert not hasattr(target, "__dict__")
+        assert not hasattr(job, "__dict__")
+
 
 class TestParallelRsync:
     def test_remote_to_remote_raises_value_error(self):
@@ -84,6 +123,65 @@ class TestParallelRsync:
 
             assert rsync.total_files == 2
 
+    def test_local_scan_includes_nested_directories(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            src = Path(tmpdir) / "src"
+            (src / "a" / "b").mkdir(parents=True)
+            (src / "top.txt").write_text("t")
+            (src / "a" / "mid.txt").write_text("m")
+            (src / "a" / "b" / "deep.txt").write_text("d")
+
+            rsync = ParallelRsync(
+                source_dir=str(src),
+                target=str(Path(tmpdir) / "dst"),
+                parallel_jobs=2,
+            )
+            rsync.scan_and_distribute()
+
+            assert rsync.total_files == 3
+            assert sorted(p for bucket in rsync.buckets for p in bucket) == sorted(
+                ["top.txt", os.path.join("a", "mid.txt"), os.path.join("a", "b", "deep.txt")]
+            )
+
+    def test_buckets_group_files_by_directory(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            src = Path(tmpdir) / "src"
+            for d in ("a", "b"):
+                (src / d).mkdir(parents=True)
+                for i in range(3):
+                    (src / d / f"{i}.txt").write_text("x" * 400_000)
+            (src / "big.bin").write_text("x" * 2_000_000)
+
+            rsync = ParallelRsync(
+                source_dir=str(src),
+                target=str(Path(tmpdir) / "dst"),
+                bucket_size_mb=1,
+                parallel_jobs=3,
+            )
+            rsync.scan_and_distribute()
+
+            assert rsync.buckets[0] == ["big.bin"]
+            dirs = [sorted({os.path.dirname(p) for p in b}) for b in rsync.buckets[1:]]
+            assert dirs == [["a"], ["b"]]
+
+    def test_bucket_files_groups_by_count(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            src = Path(tmpdir) / "src"
+            src.mkdir()
+            for i in range(5):
+                (src / f"f{i}.txt").write_text("x")
+
+            rsync = ParallelRsync(
+                source_dir=str(src),
+                target=str(Path(tmpdir) / "dst"),
+                bucket_files=2,
+            )
+            with patch("os.DirEntry.stat", side_effect=AssertionError("stat called")):
+                rsync.scan_and_distribute()
+
+            assert rsync.total_files == 5
+            assert [len(b) for b in rsync.buckets] == [2, 2, 1]
+
     def test_parse_remote_source(self):
         rsync = ParallelRsync(
             source_dir="user@host:/src",
@@ -103,6 +201,31 @@ class TestParallelRsync:
         assert rsync.is_remote_target is True
         assert rsync.remote_target.host == "host"
 
+    def test_ssh_multiplexing_is_deferred_until_first_use(self):
+        with patch("prsync.subprocess.run") as mock_run:
+            rsync = ParallelRsync(source_dir="/local/src", target="host:/remote/dst")
+            mock_run.assert_not_called()
+
+            rsync._ensure_ssh()
+            rsync._ensure_ssh()
+
+            mock_run.assert_called_once()
+            assert rsync.remote_target.control_path is not None
+            shutil.rmtree(os.path.dirname(rsync.remote_target.control_path), ignore_errors=True)
+            rsync.remote_target.control_path = None
+
+    def test_processes_terminated_before_ssh_master_exits(self):
+        rsync = ParallelRsync(source_dir="/local/src", target="host:/remote/dst")
+        with patch("prsync.subprocess.run"), patch("prsync.weakref.finalize") as mock_finalize:
+            rsync._ensure_ssh()
+        shutil.rmtree(os.path.dirname(rsync.remote_target.control_path), ignore_errors=True)
+        rsync.remote_target.control_path = None
+
+        # Finalizers run newest first, so process termination must come last
+        callbacks = [c[0][1] for c in mock_finalize.call_args_list]
+        assert callbacks[-2] == rsync.remote_target.cleanup_ssh_multiplexing
+        assert callbacks[-1] == ParallelRsync._terminate_processes
+
     def test_non_existent_source_directory_raises_error(self):
         with pytest.raises(ValueError, match="Source directory does not exist"):
             rsync = ParallelRsync(source_dir="/nonexistent/path", target="/tmp/dst")
@@ -125,7 +248,7 @@ class TestParallelRsync:
         rsync.total_files = 1
 
         job = RsyncJob(
-            source_files=[Path("test.txt")],
+            source_files=["test.txt"],
             source_base=Path("/tmp/src"),
             target="/tmp/dst",
             rsync_args=[],
@@ -150,7 +273,7 @@ class TestParallelRsync:
         rsync.total_files = 1
 
         job = RsyncJob(
-            source_files=[Path("test.txt")],
+            source_files=["test.txt"],
             source_base=Path("/tmp/src"),
             target="/tmp/dst",
             rsync_args=[],
@@ -166,6 +289,123 @@ class TestParallelRsync:
 
             assert result is True
             assert mock_popen.call_count == 1
+            assert "--files-from=-" in mock_popen.call_args[0][0]
+            proc.stdin.write.assert_called_once_with("test.txt")
+
+    def test_rsh_quotes_control_path(self):
+        rsync = ParallelRsync(source_dir="/tmp/src", target="host:/dst")
+        rsync._ssh_ready = True
+        rsync.remote_target.control_path = "/tmp/dir with space/control_%h_%p_%r"
+        rsync.total_files = 1
+        job = RsyncJob(
+            source_files=["test.txt"], source_base=Path("/tmp/src"), target="host:/dst",
+            rsync_args=[], job_id=0,
+        )
+
+        with patch("prsync.subprocess.Popen") as mock_popen:
+            proc = MagicMock()
+            proc.returncode = 0
+            mock_popen.return_value = proc
+            rsync.execute_rsync(job)
+
+        cmd = mock_popen.call_args[0][0]
+        rsh = cmd[cmd.index("--rsh") + 1]
+        assert "'ControlPath=/tmp/dir with space/control_%h_%p_%r'" in rsh
+        rsync.remote_target.control_path = None
+
+    @pytest.mark.skipif(os.name == "nt", reason="uses a POSIX shell as a stalled rsync")
+    def test_execute_rsync_timeout_covers_unread_file_list(self):
+        rsync = ParallelRsync(source_dir="/tmp/src", target="/tmp/dst", retry_count=1)
+        rsync.total_files = 1
+        # Far more than a pipe buffer, written to a child that never reads stdin
+        job = RsyncJob(
+            source_files=[f"dir/file_{i:06d}.txt" for i in range(100_000)],
+            source_base=Path("/tmp/src"),
+            target="/tmp/dst",
+            rsync_args=[],
+            job_id=0,
+            timeout=1,
+        )
+        real_popen = subprocess.Popen
+
+        def stalled_rsync(cmd, **kwargs):
+            return real_popen(["sh", "-c", "exec sleep 30"], **kwargs)
+
+        with patch("prsync.subprocess.Popen", side_effect=stalled_rsync):
+            assert rsync.execute_rsync(job) is False
+
+        _, error = rsync.failed_transfers.get_nowait()
+        assert error == "timeout"
+
+    def test_skip_existing_injects_ignore_existing(self):
+        rsync = ParallelRsync(source_dir="/tmp/src", target="/tmp/dst", rsync_args=["-a"])
+        assert rsync.rsync_args == ["-a", "--ignore-existing"]
+
+    def test_skip_existing_respects_user_update_flag(self):
+        rsync = ParallelRsync(source_dir="/tmp/src", target="/tmp/dst", rsync_args=["-a", "--update"])
+        assert "--ignore-existing" not in rsync.rsync_args
+
+    def test_skip_existing_respects_short_option_cluster(self):
+        rsync = ParallelRsync(source_dir="/tmp/src", target="/tmp/dst", rsync_args=["-avu"])
+        assert rsync.rsync_args == ["-avu"]
+
+    def test_skip_existing_ignores_option_values(self):
+        rsync = ParallelRsync(
+            source_dir="/tmp/src", target="/tmp/dst", rsync_args=["-a", "-e/usr/bin/ssh"]
+        )
+        assert rsync.rsync_args[-1] == "--ignore-existing"
+
+    def test_skip_existing_ignores_separate_option_values(self):
+        rsync = ParallelRsync(
+            source_dir="/tmp/src", target="/tmp/dst", rsync_args=["-a", "-f", "- build/"]
+        )
+        assert rsync.rsync_args == ["-a", "-f", "- build/", "--ignore-existing"]
+        rsync = ParallelRsync(
+            source_dir="/tmp/src", target="/tmp/dst", rsync_args=["-a", "--exclude", "-cu"]
+        )
+        assert rsync.rsync_args == ["-a", "--exclude", "-cu", "--ignore-existing"]
+
+    def test_skip_existing_disabled(self):
+        rsync = ParallelRsync(
+            source_dir="/tmp/src", target="/tmp/dst", rsync_args=["-a"], skip_existing=False
+        )
+        assert rsync.rsync_args == ["-a"]
+
+    def test_advance_progress_accumulates(self):
+        rsync = ParallelRsync(source_dir="/tmp/src", target="/tmp/dst")
+        assert rsync._advance_progress(3) == 3
+        assert rsync._advance_progress(2) == 5
+
+    def test_read_itemized_output_counts_transferred_files(self):
+        rsync = ParallelRsync(source_dir="/tmp/src", target="/tmp/dst")
+        rsync.total_files = 3
+        transferred = set()
+        output = [
+            "cd+++++++++ sub/\n",
+            ">f+++++++++ sub/a.txt\n",
+            "          4 100%    0.00kB/s    0:00:00\n",
+            ">f.st...... b.txt\n",
+            ">f+++++++++ sub/a.txt\n",
+        ]
+
+        rsync._read_itemized_output(iter(output), transferred)
+
+        assert transferred == {"sub/a.txt", "b.txt"}
+        assert rsync._advance_progress(1) == 3
+
+    def test_lan_appends_whole_file_args(self):
+        rsync = ParallelRsync(
+            source_dir="/tmp/src", target="/tmp/dst", rsync_args=["-avz", "--no-compress"],
+            skip_existing=False, lan=True,
+        )
+        assert rsync.rsync_args == ["-avz", "--no-compress", "--whole-file"]
+
+    def test_lan_with_ignore_existing_does_not_write_in_place(self):
+        rsync = ParallelRsync(
+            source_dir="/tmp/src", target="/tmp/dst", rsync_args=["-avz"], lan=True,
+        )
+        assert rsync.rsync_args == ["-avz", "--ignore-existing", "--whole-file", "--no-compress"]
+        assert "--inplace" not in rsync.rsync_args
 
     def test_terminate_all_clears_process_list(self):
         rsync = ParallelRsync(source_dir="/tmp/src", target="/tmp/dst")
@@ -195,6 +435,166 @@ class TestParallelRsync:
                 rsync.run()
                 assert mock_popen.call_count == 1
 
+    def test_run_single_job_merges_buckets(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            src = Path(tmpdir) / "src"
+            src.mkdir()
+            for i in range(3):
+                (src / f"f{i}.txt").write_text("data")
+
+            rsync = ParallelRsync(
+                source_dir=str(src),
+                target=str(Path(tmpdir) / "dst"),
+                parallel_jobs=1,
+                bucket_files=1,
+            )
+
+            with patch("prsync.subprocess.Popen") as mock_popen:
+                proc = MagicMock()
+                proc.returncode = 0
+                mock_popen.return_value = proc
+
+                rsync.run()
+                assert len(rsync.buckets) == 3
+                assert mock_popen.call_count == 1
+                proc.wait.assert_called_once_with(timeout=3 * RSYNC_TIMEOUT)
+
+    def test_run_dispatches_largest_buckets_first(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            src = Path(tmpdir) / "src"
+            (src / "a").mkdir(parents=True)
+            (src / "big.bin").write_text("x" * 1_100_000)
+            (src / "a" / "1.txt").write_text("x" * 900_000)
+            (src / "a" / "2.txt").write_text("x" * 900_000)
+
+            rsync = ParallelRsync(
+                source_dir=str(src),
+                target=str(Path(tmpdir) / "dst"),
+                parallel_jobs=2,
+                bucket_size_mb=1,
+            )
+
+            with patch.object(rsync, "_run_jobs", return_value=[]) as mock_run_jobs:
+                rsync.run()
+
+            assert rsync.buckets[0] == ["big.bin"]
+            jobs = mock_run_jobs.call_args[0][0]
+            assert [job.source_files for job in jobs] == [
+                [os.path.join("a", "1.txt"), os.path.join("a", "2.txt")], ["big.bin"]
+            ]
+
+    def test_run_jobs_reraises_worker_exception(self):
+        rsync = ParallelRsync(source_dir="/tmp/src", target="/tmp/dst", parallel_jobs=2)
+        jobs = [
+            RsyncJob(source_files=["f"], source_base=Path("/tmp/src"), target="/tmp/dst",
+                     rsync_args=[], job_id=i)
+            for i in range(3)
+        ]
+
+        with patch.object(rsync, "execute_rsync", side_effect=FileNotFoundError("rsync")):
+            with pytest.raises(FileNotFoundError):
+                rsync._run_jobs(jobs)
+
+    def test_local_copy_copies_without_rsync(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            src = Path(tmpdir) / "src"
+            dst = Path(tmpdir) / "dst"
+            (src / "sub").mkdir(parents=True)
+            (src / "sub" / "new.txt").write_text("new")
+            (src / "kept.txt").write_text("source")
+            dst.mkdir()
+            (dst / "kept.txt").write_text("existing")
+
+            rsync = ParallelRsync(source_dir=str(src), target=str(dst), local_copy=True)
+
+            with patch("prsync.subprocess.Popen") as mock_popen:
+                rsync.run()
+                mock_popen.assert_not_called()
+
+            assert (dst / "sub" / "new.txt").read_text() == "new"
+            assert (dst / "kept.txt").read_text() == "existing"
+
+    def test_local_copy_leaves_no_partial_file_and_retries(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            src = Path(tmpdir) / "src"
+            dst = Path(tmpdir) / "dst"
+            src.mkdir()
+            (src / "a.txt").write_text("a")
+            (src / "b.txt").write_text("b")
+
+            rsync = ParallelRsync(
+                source_dir=str(src), target=str(dst), local_copy=True, retry_count=2,
+                parallel_jobs=1,
+            )
+            real_copy2 = shutil.copy2
+            calls = []
+
+            def flaky_copy2(s, d, **kwargs):
+                calls.append(os.path.basename(s))
+                if os.path.basename(s) == "a.txt" and calls.count("a.txt") == 1:
+                    Path(d).write_text("partial")
+                    raise OSError(28, "No space left on device")
+                return real_copy2(s, d, **kwargs)
+
+            with patch("prsync.shutil.copy2", side_effect=flaky_copy2), patch("prsync.time.sleep"):
+                rsync.run()
+
+            assert calls == ["a.txt", "b.txt", "a.txt"]
+            assert (dst / "a.txt").read_text() == "a"
+            assert (dst / "b.txt").read_text() == "b"
+            assert sorted(os.listdir(dst)) == ["a.txt", "b.txt"]
+            assert rsync.failed_transfers.empty()
+
+    def test_local_copy_disabled_for_clustered_dry_run(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            src = Path(tmpdir) / "src"
+            dst = Path(tmpdir) / "dst"
+            src.mkdir()
+            (src / "a.txt").write_text("a")
+
+            rsync = ParallelRsync(
+                source_dir=str(src), target=str(dst), rsync_args=["-avn"], local_copy=True
+            )
+            assert rsync.local_copy is False
+
+            with patch("prsync.subprocess.Popen") as mock_popen:
+                proc = MagicMock()
+                proc.returncode = 0
+                mock_popen.return_value = proc
+                rsync.run()
+
+            assert not (dst / "a.txt").exists()
+
+    def test_local_copy_disabled_for_remote_target(self):
+        rsync = ParallelRsync(source_dir="/tmp/src", target="host:/dst", local_copy=True)
+        assert rsync.local_copy is False
+
+    def test_run_reports_all_failed_jobs(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            src = Path(tmpdir) / "src"
+            src.mkdir()
+            for i in range(3):
+                (src / f"f{i}.txt").write_text("data")
+
+            rsync = ParallelRsync(
+                source_dir=str(src),
+                target=str(Path(tmpdir) / "dst"),
+                parallel_jobs=3,
+                bucket_files=1,
+                retry_count=1,
+            )
+
+            with patch("prsync.subprocess.Popen") as mock_popen:
+                proc = MagicMock()
+                proc.returncode = 1
+                mock_popen.return_value = proc
+                with patch.object(rsync.logger, "error") as mock_error:
+                    rsync.run()
+
+            reported = [c for c in mock_error.call_args_list if "failed with error" in c[0][0]]
+            assert len(reported) == 3
+            assert rsync.failed_transfers.empty()
+
     def test_dry_run_appends_n_flag(self):
         from prsync import main as prsync_main
 
@@ -208,3 +608,17 @@ class TestParallelRsync:
 
             args, kwargs = mock_rsync.call_args
             assert "-n" in kwargs["rsync_args"]
+
+    def test_setup_logging_routes_through_queue(self):
+        root = logging.getLogger()
+        before = list(root.handlers)
+        listener = setup_logging(level=logging.INFO)
+        try:
+            added = [h for h in root.handlers if h not in before]
+            assert len(added) == 1
+            assert isinstance(added[0], QueueHandler)
+        finally:
+            listener.stop()
+            for handler in root.handlers[:]:
+                if handler not in before:
+                    root.removeHandler(handler)